@@ -1,13 +1,21 @@
+import contextlib
 import logging
 import os
-from typing import Dict, List
+from typing import Dict, List, Optional
 
 import cv2
 
+from agents.frame_store import PACK_SUFFIX, FramePackWriter
+
 
 class FrameExtractor:
     """
     Extracts frames corresponding to each scene from the video.
+
+    With storage="pack" (default) all frames of the video are appended to a
+    single '<video name>.pack' file in `output_dir`, and `frame_paths` holds
+    path-like keys into it (see agents.frame_store). With storage="loose" every
+    frame is written as a separate JPEG file.
     """
 
     def __init__(
@@ -16,6 +24,7 @@ class FrameExtractor:
         scenes: List[Dict],
         output_dir: str = "frames",
         frames_per_scene: int = 1,
+        storage: str = "pack",
     ):
         self.logger = logging.getLogger("FrameExtractor")
         self.video_path = video_path
@@ -24,6 +33,11 @@ class FrameExtractor:
         self.frames_per_scene = (
             frames_per_scene  # Number of frames to extract per scene
         )
+        self.storage = storage.lower()
+
+        if self.storage not in ("pack", "loose"):
+            self.logger.error(f"Unsupported frame storage: {self.storage}")
+            raise ValueError(f"Unsupported frame storage: {self.storage}")
 
         # Create output directory if it doesn't exist
         os.makedirs(self.output_dir, exist_ok=True)
@@ -44,55 +58,93 @@ class FrameExtractor:
 
         frame_data_list = []
 
-        for scene in self.scenes:
-            scene_number = scene["cut_scene_number"]
-            start_frame = int(scene["start_frame"])
-            end_frame = int(scene["end_frame"])
-            total_frames = end_frame - start_frame + 1
+        if self.storage == "pack":
+            video_name = os.path.splitext(os.path.basename(self.video_path))[0]
+            pack_path = os.path.join(self.output_dir, video_name + PACK_SUFFIX)
+            pack_context = FramePackWriter(pack_path)
+        else:
+            pack_context = contextlib.nullcontext()
+
+        try:
+            # The pack is only published if every scene was processed
+            with pack_context as pack_writer:
+                for scene in self.scenes:
+                    # Update scene metadata with frame paths
+                    scene["frame_paths"] = self._extract_scene_frames(
+                        cap, scene, pack_writer
+                    )
+                    frame_data_list.append(scene)
 
-            # self.logger.debug(
-            #     f"Extracting frames for Scene {scene_number}: Frames {start_frame} to {end_frame}"
-            # )
+                    self.logger.info(
+                        f"Extracted {len(scene['frame_paths'])} frames for Scene {scene['cut_scene_number']}"
+                    )
+        finally:
+            cap.release()
 
-            # Determine frame indices to extract
-            if self.frames_per_scene >= total_frames:
-                # Extract all frames in the scene
-                frame_indices = list(range(start_frame, end_frame + 1))
-            else:
-                # Evenly distribute frames across the scene
-                frame_indices = self._get_frame_indices(
-                    start_frame, end_frame, self.frames_per_scene
-                )
+        self.logger.info("Frame extraction completed.")
+
+        return frame_data_list
+
+    def _extract_scene_frames(
+        self, cap, scene: Dict, pack_writer: Optional[FramePackWriter]
+    ) -> List[str]:
+        """
+        Extracts the frames of one scene.
+
+        Args:
+            cap (cv2.VideoCapture): Opened video.
+            scene (Dict): Scene metadata.
+            pack_writer (Optional[FramePackWriter]): Pack to append frames to, None for loose files.
+
+        Returns:
+            List[str]: Frame keys (packed) or frame file paths (loose).
+        """
+        scene_number = scene["cut_scene_number"]
+        start_frame = int(scene["start_frame"])
+        end_frame = int(scene["end_frame"])
+        total_frames = end_frame - start_frame + 1
+
+        # self.logger.debug(
+        #     f"Extracting frames for Scene {scene_number}: Frames {start_frame} to {end_frame}"
+        # )
+
+        # Determine frame indices to extract
+        if self.frames_per_scene >= total_frames:
+            # Extract all frames in the scene
+            frame_indices = list(range(start_frame, end_frame + 1))
+        else:
+            # Evenly distribute frames across the scene
+            frame_indices = self._get_frame_indices(
+                start_frame, end_frame, self.frames_per_scene
+            )
+
+        frame_paths = []
 
-            frame_paths = []
+        for frame_idx in frame_indices:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
+            ret, frame = cap.read()
 
-            for frame_idx in frame_indices:
-                cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
-                ret, frame = cap.read()
+            if not ret:
+                self.logger.warning(
+                    f"Failed to read frame {frame_idx} for Scene {scene_number}"
+                )
+                continue
 
-                if not ret:
+            frame_filename = f"scene_{scene_number}_frame_{frame_idx}.jpg"
+            if pack_writer is not None:
+                ok, encoded_frame = cv2.imencode(".jpg", frame)
+                if not ok:
                     self.logger.warning(
-                        f"Failed to read frame {frame_idx} for Scene {scene_number}"
+                        f"Failed to encode frame {frame_idx} for Scene {scene_number}"
                     )
                     continue
-
-                frame_filename = f"scene_{scene_number}_frame_{frame_idx}.jpg"
+                frame_path = pack_writer.append(frame_filename, encoded_frame)
+            else:
                 frame_path = os.path.join(self.output_dir, frame_filename)
                 cv2.imwrite(frame_path, frame)
-                frame_paths.append(frame_path)
-
-            # Update scene metadata with frame paths
-            scene["frame_paths"] = frame_paths
-            frame_data_list.append(scene)
-
-            self.logger.info(
-                f"Extracted {len(frame_paths)} frames for Scene {scene_number}"
-            )
+            frame_paths.append(frame_path)
 
-        cap.release()
-        self.logger.info("Frame extraction completed.")
-
-        return frame_data_list
+        return frame_paths
 
     def _get_frame_indices(
         self, start_frame: int, end_frame: int, num_frames: int
@@ -0,0 +1,288 @@
+import argparse
+import json
+import logging
+import mmap
+import os
+import struct
+from typing import Dict, List, Optional, Tuple
+
+PACK_SUFFIX = ".pack"
+
+# A pack is laid out as: encoded frames | JSON offset index | trailer. The
+# trailer holds the offset of the index and a magic tag, so the frames and
+# their index are published together by a single os.replace.
+PACK_MAGIC = b"FRMPACK1"
+PACK_TRAILER = struct.Struct("<Q8s")
+
+# One reader per pack file and per process, so that captioning workers map
+# every pack only once no matter how many frames they read from it.
+_open_readers: Dict[str, "FramePackReader"] = {}
+
+
+def split_frame_key(frame_key: str) -> Optional[Tuple[str, str]]:
+    """
+    Splits a packed frame key into the pack path and the frame name.
+
+    Packed frames are addressed with path-like keys such as
+    'frames/minecraft.pack/scene_1_frame_0.jpg', so they can live in
+    `frame_paths` next to (or instead of) loose file paths.
+
+    Args:
+        frame_key (str): Frame key or loose frame path.
+
+    Returns:
+        Optional[Tuple[str, str]]: (pack_path, frame_name), or None for a loose file.
+    """
+    pack_path, frame_name = os.path.split(frame_key)
+    if not pack_path.endswith(PACK_SUFFIX):
+        return None
+    if pack_path not in _open_readers and not os.path.isfile(pack_path):
+        return None
+    return pack_path, frame_name
+
+
+class FramePackWriter:
+    """
+    Appends encoded frames of one video to a single pack file with an offset index.
+    """
+
+    def __init__(self, pack_path: str):
+        self.logger = logging.getLogger("FramePackWriter")
+        self.pack_path = pack_path
+        self.index = {}
+        self._offset = 0
+
+        pack_dir = os.path.dirname(self.pack_path)
+        if pack_dir:
+            os.makedirs(pack_dir, exist_ok=True)
+        # Frames go to a temporary file that replaces the pack only on close,
+        # so an existing pack (possibly memory mapped) is never truncated
+        self._tmp_pack_path = self.pack_path + ".tmp"
+        self._file = open(self._tmp_pack_path, "wb")
+
+    def append(self, frame_name: str, data) -> str:
+        """
+        Appends one encoded frame to the pack.
+
+        Args:
+            frame_name (str): Frame name, e.g. 'scene_1_frame_0.jpg'.
+            data: Encoded image (bytes or any buffer, e.g. the output of cv2.imencode).
+
+        Returns:
+            str: Path-like key of the stored frame.
+        """
+        length = memoryview(data).nbytes
+        self._file.write(data)
+        self.index[frame_name] = [self._offset, length]
+        self._offset += length
+        return os.path.join(self.pack_path, frame_name)
+
+    def close(self):
+        """
+        Appends the index and the trailer to the pack and publishes it.
+        """
+        if self._file.closed:
+            return
+        self._file.write(json.dumps(self.index).encode("utf-8"))
+        self._file.write(PACK_TRAILER.pack(self._offset, PACK_MAGIC))
+        self._file.close()
+
+        os.replace(self._tmp_pack_path, self.pack_path)
+
+        # A reader cached in this process still maps the replaced pack
+        _open_readers.pop(self.pack_path, None)
+
+        self.logger.info(
+            f"Packed {len(self.index)} frames ({self._offset} bytes) into {self.pack_path}"
+        )
+
+    def __enter__(self):
+        return self
+
+    def abort(self):
+        """
+        Discards the frames written so far and keeps any previous pack as it is.
+        """
+        if self._file.closed:
+            return
+        self._file.close()
+        os.remove(self._tmp_pack_path)
+        self.logger.warning(f"Discarded unfinished pack {self.pack_path}")
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class FramePackReader:
+    """
+    Reads frames from a pack file through a memory map, without copying them.
+    """
+
+    def __init__(self, pack_path: str):
+        self.pack_path = pack_path
+
+        self._file = open(self.pack_path, "rb")
+        pack_size = os.fstat(self._file.fileno()).st_size
+        if pack_size < PACK_TRAILER.size:
+            self._file.close()
+            raise ValueError(f"Not a frame pack: {pack_path}")
+
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+
+        index_offset, magic = PACK_TRAILER.unpack_from(
+            self._mmap, pack_size - PACK_TRAILER.size
+        )
+        if magic != PACK_MAGIC or index_offset > pack_size - PACK_TRAILER.size:
+            self.close()
+            raise ValueError(f"Not a frame pack: {pack_path}")
+        self.index = json.loads(
+            self._mmap[index_offset : pack_size - PACK_TRAILER.size].decode("utf-8")
+        )
+
+    def names(self) -> List[str]:
+        return list(self.index.keys())
+
+    def read(self, frame_name: str) -> memoryview:
+        """
+        Returns the encoded frame as a zero-copy view into the memory map.
+
+        Args:
+            frame_name (str): Frame name inside the pack.
+
+        Returns:
+            memoryview: Encoded image bytes.
+        """
+        offset, length = self.index[frame_name]
+        return self._view[offset : offset + length]
+
+    def export_loose(self, output_dir: str) -> Dict[str, str]:
+        """
+        Writes every packed frame to `output_dir` as a separate file.
+
+        Args:
+            output_dir (str): Directory for the loose frame files.
+
+        Returns:
+            Dict[str, str]: Mapping from packed frame key to loose file path.
+        """
+        os.makedirs(output_dir, exist_ok=True)
+
+        exported = {}
+        for frame_name in self.index:
+            frame_path = os.path.join(output_dir, frame_name)
+            with open(frame_path, "wb") as frame_file:
+                frame_file.write(self.read(frame_name))
+            exported[os.path.join(self.pack_path, frame_name)] = frame_path
+
+        return exported
+
+    def close(self):
+        """
+        Unmaps the pack. Views returned by `read` must be released beforehand.
+        """
+        self._view.release()
+        self._mmap.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def read_frame(frame_key: str):
+    """
+    Reads an encoded frame given its key from `frame_paths`.
+
+    Packed frames are served from a per-process memory map; loose frame
+    files are read from disk as before.
+
+    Args:
+        frame_key (str): Packed frame key or loose frame path.
+
+    Returns:
+        Encoded image bytes (a memoryview for packed frames).
+    """
+    parts = split_frame_key(frame_key)
+    if parts is None:
+        with open(frame_key, "rb") as frame_file:
+            return frame_file.read()
+
+    pack_path, frame_name = parts
+    reader = _open_readers.get(pack_path)
+    if reader is None:
+        reader = FramePackReader(pack_path)
+        _open_readers[pack_path] = reader
+    return reader.read(frame_name)
+
+
+def export_loose_frames(scenes: List[Dict], output_dir: str) -> List[Dict]:
+    """
+    Exports packed frames of the scenes as loose files and rewrites `frame_paths`
+    (and the `frame_path` of captions) to point to them. Frames of every pack
+    go to their own subdirectory named after the pack, e.g. 'minecraft/'.
+
+    Args:
+        scenes (List[Dict]): Scene metadata with packed frame keys.
+        output_dir (str): Directory for the loose frame files.
+
+    Returns:
+        List[Dict]: Updated scene metadata with loose frame paths.
+    """
+    pack_paths = set()
+    for scene in scenes:
+        for frame_key in scene.get("frame_paths", []):
+            parts = split_frame_key(frame_key)
+            if parts is not None:
+                pack_paths.add(parts[0])
+
+    exported = {}
+    for pack_path in sorted(pack_paths):
+        pack_name = os.path.basename(pack_path)[: -len(PACK_SUFFIX)]
+        with FramePackReader(pack_path) as reader:
+            exported.update(reader.export_loose(os.path.join(output_dir, pack_name)))
+
+    for scene in scenes:
+        if "frame_paths" in scene:
+            scene["frame_paths"] = [
+                exported.get(frame_key, frame_key) for frame_key in scene["frame_paths"]
+            ]
+        for caption in scene.get("captions", []):
+            caption["frame_path"] = exported.get(
+                caption["frame_path"], caption["frame_path"]
+            )
+
+    return scenes
+
+
+if __name__ == "__main__":
+    # python -m agents.frame_store --pack_path "./frames/minecraft.pack" --output_dir "./frames_loose"
+    parser = argparse.ArgumentParser(
+        description="Export frames stored in a pack file as loose image files."
+    )
+
+    parser.add_argument(
+        "--pack_path",
+        type=str,
+        default=None,
+        help="Path to the '.pack' file written by FrameExtractor.",
+    )
+    parser.add_argument(
+        "--output_dir",
+        type=str,
+        default=None,
+        help="Directory to write the loose frame files to.",
+    )
+
+    # Parse the arguments
+    args = parser.parse_args()
+
+    with FramePackReader(args.pack_path) as pack_reader:
+        exported_frames = pack_reader.export_loose(args.output_dir)
+
+    print(f"Exported {len(exported_frames)} frames to '{args.output_dir}'.")
@@ -2,16 +2,17 @@ import base64
 import logging
 import multiprocessing
 import os
-from typing import Dict, List
+from typing import Dict, List, Optional
 
 import openai
 
+from agents.frame_store import read_frame
 from agents.utils import setup_logger
 
 
 def encode_image(image_path: str) -> str:
-    with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode("utf-8")
+    # Works both for loose frame files and for keys into a frame pack
+    return base64.b64encode(read_frame(image_path)).decode("utf-8")
 
 
 def generate_caption_one_image(
@@ -108,11 +109,20 @@ class ImageCaptioningAgent:
     Generates captions for frames extracted from scenes.
     """
 
-    def __init__(self, num_processes: int, scenes: List[Dict], openai_api_key: str):
+    def __init__(
+        self,
+        num_processes: int,
+        scenes: List[Dict],
+        openai_api_key: str,
+        start_method: Optional[str] = None,
+    ):
         self.logger = logging.getLogger("ImageCaptioningAgent")
         self.num_processes = num_processes
         self.scenes = scenes
         self.openai_api_key = openai_api_key
+        # Start method of the worker processes ('fork', 'spawn' or 'forkserver').
+        # None uses the platform default.
+        self.start_method = start_method
 
     def generate_captions(self) -> List[Dict]:
         """
@@ -126,7 +136,8 @@ class ImageCaptioningAgent:
         # Prepare chunks for multiprocessing
         chunks = [(scene, self.openai_api_key) for scene in self.scenes]
 
-        with multiprocessing.Pool(processes=self.num_processes) as pool:
+        mp_context = multiprocessing.get_context(self.start_method)
+        with mp_context.Pool(processes=self.num_processes) as pool:
             results = pool.starmap(generate_caption_one_cut_scene, chunks)
 
         self.logger.info("Image captioning for all scenes completed.")
@@ -0,0 +1,560 @@
+import argparse
+import json
+import logging
+import os
+import sqlite3
+from typing import Dict, Iterator, List, Optional
+
+# Keys of a scene dictionary that are stored in typed columns, with the Python
+# type each column holds. Other keys, and values whose type does not match the
+# column (which SQLite would silently convert, e.g. 0 -> 0.0 or "5" -> 5), are
+# kept in the `extra` JSON column; the original key order is kept in
+# `key_order`. This makes round trips to JSON lossless.
+SCENE_COLUMN_TYPES = {
+    "cut_scene_number": int,
+    "start_timecode": str,
+    "end_timecode": str,
+    "start_seconds": float,
+    "end_seconds": float,
+    "start_frame": int,
+    "end_frame": int,
+}
+SCENE_COLUMNS = list(SCENE_COLUMN_TYPES)
+
+# Keys of a caption dictionary that are stored in typed columns; the same
+# `extra` and key order handling applies to captions
+CAPTION_COLUMNS = ["frame_path", "caption", "setting"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS videos (
+    video_id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS labels (
+    label_id INTEGER PRIMARY KEY,
+    label TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS scenes (
+    video_id INTEGER NOT NULL REFERENCES videos (video_id),
+    scene_order INTEGER NOT NULL,
+    cut_scene_number INTEGER,
+    start_timecode TEXT,
+    end_timecode TEXT,
+    start_seconds REAL,
+    end_seconds REAL,
+    start_frame INTEGER,
+    end_frame INTEGER,
+    key_order TEXT NOT NULL,
+    extra TEXT,
+    PRIMARY KEY (video_id, scene_order)
+);
+CREATE TABLE IF NOT EXISTS frames (
+    video_id INTEGER NOT NULL,
+    scene_order INTEGER NOT NULL,
+    frame_order INTEGER NOT NULL,
+    frame_path TEXT,
+    in_frame_paths INTEGER NOT NULL,
+    caption_order INTEGER,
+    caption TEXT,
+    label_id INTEGER REFERENCES labels (label_id),
+    caption_key_order TEXT,
+    extra TEXT,
+    PRIMARY KEY (video_id, scene_order, frame_order)
+);
+CREATE INDEX IF NOT EXISTS frames_by_label ON frames (label_id);
+"""
+
+
+def _fits_column(value, column_type: type) -> bool:
+    """
+    Checks that SQLite stores the value in a column of the given type unchanged.
+    """
+    if value is None:
+        return True
+    if type(value) is not column_type:
+        return False
+    if column_type is int:
+        return -(2**63) <= value < 2**63
+    if column_type is float:
+        return value == value  # NaN would be stored as NULL
+    return True
+
+
+def _split_scene(scene: Dict) -> tuple:
+    """
+    Splits a scene into typed column values and the `extra` keys.
+    """
+    columns = {}
+    extra = {}
+    for key, value in scene.items():
+        if key in SCENE_COLUMN_TYPES and _fits_column(value, SCENE_COLUMN_TYPES[key]):
+            columns[key] = value
+        elif key == "frame_paths" and isinstance(value, list) and all(
+            isinstance(frame_path, str) for frame_path in value
+        ):
+            continue
+        elif key == "captions" and isinstance(value, list) and all(
+            isinstance(caption, dict) for caption in value
+        ):
+            continue
+        else:
+            extra[key] = value
+    return columns, extra
+
+
+def _scene_frames(frame_paths: List[str], captions: List[Dict]) -> List[Dict]:
+    """
+    Merges `frame_paths` and `captions` of a scene into one row per frame.
+    """
+    rows = []
+    caption_by_path = {}
+    for caption_order, caption in enumerate(captions):
+        columns = {
+            key: value
+            for key, value in caption.items()
+            if key in CAPTION_COLUMNS and _fits_column(value, str)
+        }
+        extra = {
+            key: value for key, value in caption.items() if key not in columns
+        }
+        row = {
+            "frame_path": columns.get("frame_path"),
+            "in_frame_paths": 0,
+            "caption_order": caption_order,
+            "caption": columns.get("caption"),
+            "setting": columns.get("setting"),
+            "caption_key_order": json.dumps(list(caption.keys()), ensure_ascii=False),
+            "extra": json.dumps(extra, ensure_ascii=False) if extra else None,
+        }
+        rows.append(row)
+        if row["frame_path"] is not None:
+            caption_by_path.setdefault(row["frame_path"], row)
+
+    # Frames listed in `frame_paths` reuse the row of their caption if it exists
+    frame_rows = []
+    for frame_path in frame_paths:
+        row = caption_by_path.pop(frame_path, None)
+        if row is None:
+            row = {
+                "frame_path": frame_path,
+                "in_frame_paths": 1,
+                "caption_order": None,
+                "caption": None,
+                "setting": None,
+                "caption_key_order": None,
+                "extra": None,
+            }
+        else:
+            row["in_frame_paths"] = 1
+        frame_rows.append(row)
+
+    # Frame order follows `frame_paths`, captions without a frame path go last
+    seen = set(id(row) for row in frame_rows)
+    return frame_rows + [row for row in rows if id(row) not in seen]
+
+
+class ResultsWriter:
+    """
+    Writes scenes with frame predictions into a SQLite results database.
+
+    Labels are dictionary-encoded in the `labels` table and referenced by id
+    from the `frames` table.
+    """
+
+    def __init__(self, db_path: str):
+        self.logger = logging.getLogger("ResultsWriter")
+        self.db_path = db_path
+
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+
+        self.connection = sqlite3.connect(self.db_path)
+        self.connection.executescript(SCHEMA)
+        self._label_ids = self._load_label_ids()
+
+    def _load_label_ids(self) -> Dict[str, int]:
+        return dict(
+            (label, label_id)
+            for label_id, label in self.connection.execute(
+                "SELECT label_id, label FROM labels"
+            )
+        )
+
+    def _label_id(self, label: Optional[str]) -> Optional[int]:
+        if label is None:
+            return None
+        label_id = self._label_ids.get(label)
+        if label_id is None:
+            cursor = self.connection.execute(
+                "INSERT INTO labels (label) VALUES (?)", (label,)
+            )
+            label_id = cursor.lastrowid
+            self._label_ids[label] = label_id
+        return label_id
+
+    def write_video(self, video_name: str, scenes: List[Dict]):
+        """
+        Stores the scenes of one video, replacing previously stored ones.
+
+        Args:
+            video_name (str): Name identifying the video, e.g. 'minecraft'.
+            scenes (List[Dict]): Scene metadata in the pipeline JSON schema.
+        """
+        try:
+            scene_rows, frame_rows = self._write_video(video_name, scenes)
+        except Exception:
+            # Labels inserted by the rolled back transaction no longer exist
+            self._label_ids = self._load_label_ids()
+            raise
+
+        self.logger.info(
+            f"Stored {len(scene_rows)} scenes with {len(frame_rows)} frames of video '{video_name}'"
+        )
+
+    def _write_video(self, video_name: str, scenes: List[Dict]) -> tuple:
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR IGNORE INTO videos (name) VALUES (?)", (video_name,)
+            )
+            (video_id,) = self.connection.execute(
+                "SELECT video_id FROM videos WHERE name = ?", (video_name,)
+            ).fetchone()
+            self.connection.execute("DELETE FROM frames WHERE video_id = ?", (video_id,))
+            self.connection.execute("DELETE FROM scenes WHERE video_id = ?", (video_id,))
+
+            scene_rows = []
+            frame_rows = []
+            for scene_order, scene in enumerate(scenes):
+                columns, extra = _split_scene(scene)
+                scene_rows.append(
+                    (video_id, scene_order)
+                    + tuple(columns.get(column) for column in SCENE_COLUMNS)
+                    + (
+                        json.dumps(list(scene.keys()), ensure_ascii=False),
+                        json.dumps(extra, ensure_ascii=False) if extra else None,
+                    )
+                )
+                scene_frames = _scene_frames(
+                    [] if "frame_paths" in extra else scene.get("frame_paths", []),
+                    [] if "captions" in extra else scene.get("captions", []),
+                )
+                for frame_order, frame in enumerate(scene_frames):
+                    frame_rows.append(
+                        (
+                            video_id,
+                            scene_order,
+                            frame_order,
+                            frame["frame_path"],
+                            frame["in_frame_paths"],
+                            frame["caption_order"],
+                            frame["caption"],
+                            self._label_id(frame["setting"]),
+                            frame["caption_key_order"],
+                            frame["extra"],
+                        )
+                    )
+
+            self.connection.executemany(
+                f"INSERT INTO scenes (video_id, scene_order, {', '.join(SCENE_COLUMNS)}, "
+                "key_order, extra) "
+                f"VALUES ({', '.join('?' * (len(SCENE_COLUMNS) + 4))})",
+                scene_rows,
+            )
+            self.connection.executemany(
+                "INSERT INTO frames VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", frame_rows
+            )
+
+        return scene_rows, frame_rows
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class ResultsReader:
+    """
+    Reads scenes and frame predictions from a SQLite results database.
+
+    Videos are loaded lazily one at a time; frame-level queries run directly
+    on the typed columns without materializing whole videos.
+    """
+
+    def __init__(self, db_path: str):
+        if not os.path.exists(db_path):
+            raise FileNotFoundError(f"Results database not found: {db_path}")
+
+        self.db_path = db_path
+        self.connection = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+
+    def videos(self) -> List[str]:
+        return [
+            name
+            for (name,) in self.connection.execute(
+                "SELECT name FROM videos ORDER BY video_id"
+            )
+        ]
+
+    def labels(self) -> List[str]:
+        return [
+            label
+            for (label,) in self.connection.execute(
+                "SELECT label FROM labels ORDER BY label_id"
+            )
+        ]
+
+    def load_video(self, video_name: str) -> List[Dict]:
+        """
+        Loads the scenes of one video in the pipeline JSON schema.
+
+        Args:
+            video_name (str): Name of the stored video.
+
+        Returns:
+            List[Dict]: Scene metadata as in 'scenes_with_settings_predicted.json'.
+        """
+        row = self.connection.execute(
+            "SELECT video_id FROM videos WHERE name = ?", (video_name,)
+        ).fetchone()
+        if row is None:
+            raise KeyError(f"Video not found in results: {video_name}")
+        (video_id,) = row
+
+        scenes = []
+        key_orders = []
+        for scene_row in self.connection.execute(
+            f"SELECT {', '.join(SCENE_COLUMNS)}, key_order, extra "
+            "FROM scenes WHERE video_id = ? ORDER BY scene_order",
+            (video_id,),
+        ):
+            scene = dict(zip(SCENE_COLUMNS, scene_row[: len(SCENE_COLUMNS)]))
+            key_order, extra = scene_row[len(SCENE_COLUMNS) :]
+            if extra is not None:
+                scene.update(json.loads(extra))
+            scenes.append(scene)
+            key_orders.append(json.loads(key_order))
+
+        # Frame paths and captions stored as frame rows, per scene
+        frame_paths = [[] for _ in scenes]
+        captions = [[] for _ in scenes]
+
+        for (
+            scene_order,
+            frame_path,
+            in_frame_paths,
+            caption_order,
+            caption,
+            label,
+            caption_key_order,
+            extra,
+        ) in self.connection.execute(
+            "SELECT frames.scene_order, frames.frame_path, frames.in_frame_paths, "
+            "frames.caption_order, frames.caption, labels.label, "
+            "frames.caption_key_order, frames.extra "
+            "FROM frames LEFT JOIN labels ON frames.label_id = labels.label_id "
+            "WHERE frames.video_id = ? ORDER BY frames.scene_order, frames.frame_order",
+            (video_id,),
+        ):
+            if in_frame_paths:
+                frame_paths[scene_order].append(frame_path)
+            if caption_order is not None:
+                caption_data = {
+                    "frame_path": frame_path,
+                    "caption": caption,
+                    "setting": label,
+                }
+                if extra is not None:
+                    caption_data.update(json.loads(extra))
+                caption_data = {
+                    key: caption_data[key] for key in json.loads(caption_key_order)
+                }
+                captions[scene_order].append((caption_order, caption_data))
+
+        # Restore the caption order within the scenes and the original key order
+        for scene_order, scene in enumerate(scenes):
+            # Values that are not lists of strings/dictionaries are kept in `extra`
+            scene.setdefault("frame_paths", frame_paths[scene_order])
+            scene.setdefault(
+                "captions",
+                [
+                    caption_data
+                    for _, caption_data in sorted(
+                        captions[scene_order], key=lambda item: item[0]
+                    )
+                ],
+            )
+            scenes[scene_order] = {key: scene[key] for key in key_orders[scene_order]}
+
+        return scenes
+
+    def iter_videos(self) -> Iterator[tuple]:
+        """
+        Yields (video_name, scenes) pairs, loading one video at a time.
+        """
+        for video_name in self.videos():
+            yield video_name, self.load_video(video_name)
+
+    def frames_with_label(
+        self, label: str, video_name: Optional[str] = None
+    ) -> List[Dict]:
+        """
+        Finds all frames predicted with the given label, e.g. 'nether: nether wastes'.
+
+        Args:
+            label (str): Setting label to look for.
+            video_name (Optional[str]): Restrict the search to one video.
+
+        Returns:
+            List[Dict]: One dictionary per frame with video name, scene timing and frame path.
+        """
+        query = (
+            "SELECT videos.name, scenes.cut_scene_number, scenes.start_timecode, "
+            "scenes.end_timecode, scenes.start_seconds, scenes.end_seconds, "
+            "frames.frame_path, frames.caption "
+            "FROM frames "
+            "JOIN labels ON frames.label_id = labels.label_id "
+            "JOIN scenes ON frames.video_id = scenes.video_id "
+            "AND frames.scene_order = scenes.scene_order "
+            "JOIN videos ON frames.video_id = videos.video_id "
+            "WHERE labels.label = ?"
+        )
+        params = [label]
+        if video_name is not None:
+            query += " AND videos.name = ?"
+            params.append(video_name)
+        query += " ORDER BY frames.video_id, frames.scene_order, frames.frame_order"
+
+        columns = [
+            "video_name",
+            "cut_scene_number",
+            "start_timecode",
+            "end_timecode",
+            "start_seconds",
+            "end_seconds",
+            "frame_path",
+            "caption",
+        ]
+        return [
+            dict(zip(columns, row)) for row in self.connection.execute(query, params)
+        ]
+
+    def label_counts(self, video_name: Optional[str] = None) -> Dict[str, int]:
+        """
+        Counts predicted frames per label.
+        """
+        query = (
+            "SELECT labels.label, COUNT(*) FROM frames "
+            "JOIN labels ON frames.label_id = labels.label_id"
+        )
+        params = []
+        if video_name is not None:
+            query += (
+                " JOIN videos ON frames.video_id = videos.video_id WHERE videos.name = ?"
+            )
+            params.append(video_name)
+        query += " GROUP BY labels.label ORDER BY COUNT(*) DESC"
+        return dict(self.connection.execute(query, params))
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def json_to_results(json_path: str, db_path: str, video_name: Optional[str] = None):
+    """
+    Converts a results JSON file (list of scenes) into the results database.
+
+    Args:
+        json_path (str): Path to e.g. 'scenes_with_settings_predicted.json'.
+        db_path (str): Path to the SQLite results database.
+        video_name (Optional[str]): Video name, defaults to the JSON file name.
+    """
+    if video_name is None:
+        video_name = os.path.splitext(os.path.basename(json_path))[0]
+
+    with open(json_path, "r", encoding="utf-8") as json_file:
+        scenes = json.load(json_file)
+
+    with ResultsWriter(db_path) as writer:
+        writer.write_video(video_name, scenes)
+
+
+def results_to_json(db_path: str, video_name: str, json_path: str):
+    """
+    Exports one video from the results database to the JSON schema.
+
+    Args:
+        db_path (str): Path to the SQLite results database.
+        video_name (str): Name of the stored video.
+        json_path (str): Path of the JSON file to write.
+    """
+    with ResultsReader(db_path) as reader:
+        scenes = reader.load_video(video_name)
+
+    with open(json_path, "w", encoding="utf-8") as json_file:
+        json.dump(scenes, json_file, ensure_ascii=False, indent=4)
+
+
+if __name__ == "__main__":
+    # python -m agents.results_store import --db_path "./results/results.db" --json_path "./results/scenes_with_settings_predicted.json" --video_name "minecraft"
+    # python -m agents.results_store export --db_path "./results/results.db" --json_path "./results/minecraft.json" --video_name "minecraft"
+    # python -m agents.results_store query --db_path "./results/results.db" --label "nether: nether wastes"
+    parser = argparse.ArgumentParser(
+        description="Convert and query the SQLite results database."
+    )
+
+    parser.add_argument(
+        "command",
+        type=str,
+        choices=["import", "export", "query"],
+        help="'import' a JSON results file, 'export' a video to JSON, or 'query' frames by label.",
+    )
+    parser.add_argument(
+        "--db_path",
+        type=str,
+        default=None,
+        help="Path to the SQLite results database.",
+    )
+    parser.add_argument(
+        "--json_path",
+        type=str,
+        default=None,
+        help="Path to the JSON results file to import or export.",
+    )
+    parser.add_argument(
+        "--video_name",
+        type=str,
+        default=None,
+        help="Name of the video in the database.",
+    )
+    parser.add_argument(
+        "--label",
+        type=str,
+        default=None,
+        help="Setting label to query frames for.",
+    )
+
+    # Parse the arguments
+    args = parser.parse_args()
+
+    if args.command == "import":
+        json_to_results(args.json_path, args.db_path, args.video_name)
+    elif args.command == "export":
+        results_to_json(args.db_path, args.video_name, args.json_path)
+    else:
+        with ResultsReader(args.db_path) as results_reader:
+            for frame in results_reader.frames_with_label(args.label, args.video_name):
+                print(
+                    f"{frame['video_name']}\t{frame['cut_scene_number']}\t"
+                    f"{frame['start_timecode']}\t{frame['end_timecode']}\t{frame['frame_path']}"
+                )
@@ -1,7 +1,7 @@
 import logging
 import multiprocessing
 import os
-from typing import Dict, List
+from typing import Dict, List, Optional
 
 import openai
 
@@ -131,12 +131,16 @@ class SettingClassifierAgent:
         scenes: List[Dict],
         possible_settings: List[str],
         openai_api_key: str,
+        start_method: Optional[str] = None,
     ):
         self.logger = logging.getLogger("SettingClassifierAgent")
         self.num_processes = num_processes
         self.scenes = scenes
         self.possible_settings = possible_settings
         self.openai_api_key = openai_api_key
+        # Start method of the worker processes ('fork', 'spawn' or 'forkserver').
+        # None uses the platform default.
+        self.start_method = start_method
 
     def classify_settings(self) -> List[Dict]:
         """
@@ -153,7 +157,8 @@ class SettingClassifierAgent:
             for scene in self.scenes
         ]
 
-        with multiprocessing.Pool(processes=self.num_processes) as pool:
+        mp_context = multiprocessing.get_context(self.start_method)
+        with mp_context.Pool(processes=self.num_processes) as pool:
             results = pool.starmap(classify_settings_one_cut_scene, chunks)
 
         self.logger.info("Setting classification for all scenes completed.")
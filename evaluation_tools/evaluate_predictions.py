@@ -0,0 +1,482 @@
+import argparse
+import json
+import logging
+import math
+import os
+import sys
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+working_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, working_dir)
+
+from agents.results_store import ResultsReader  # noqa: E402
+
+# Label assigned to frames of the reference that a prediction run does not contain
+MISSING_LABEL = "unknown"
+
+logger = logging.getLogger("evaluate_predictions")
+
+
+def iter_videos(path: str, video_name: str = "video") -> Iterator[Tuple[str, List[Dict]]]:
+    """
+    Yields (video_name, scenes) pairs from a results JSON file or a results database.
+
+    A JSON file holds the scenes of a single video, named `video_name`; a
+    database ('.db') yields all of its videos one at a time.
+    """
+    if path.endswith(".db"):
+        with ResultsReader(path) as reader:
+            yield from reader.iter_videos()
+    else:
+        with open(path, "r", encoding="utf-8") as json_file:
+            yield video_name, json.load(json_file)
+
+
+def collect_frame_labels(
+    path: str, video_name: str = "video"
+) -> Tuple[List[tuple], List[str], List[float], List[str]]:
+    """
+    Flattens the frame-level settings of a results file.
+
+    Frames are keyed by (video name, cut scene number, frame position in the
+    scene). Each frame gets an equal share of its scene duration
+    (`end_seconds - start_seconds`).
+
+    Returns:
+        Tuple of frame keys, labels, durations and video names per frame.
+    """
+    keys = []
+    labels = []
+    durations = []
+    videos = []
+    for name, scenes in iter_videos(path, video_name):
+        for scene in scenes:
+            captions = scene.get("captions", [])
+            if not captions:
+                continue
+            duration = (scene["end_seconds"] - scene["start_seconds"]) / len(captions)
+            for frame_order, caption in enumerate(captions):
+                keys.append((name, scene["cut_scene_number"], frame_order))
+                labels.append(caption.get("setting") or "")
+                durations.append(duration)
+                videos.append(name)
+    return keys, labels, durations, videos
+
+
+def confusion_matrices(
+    y_true: np.ndarray,
+    y_pred: np.ndarray,
+    n_classes: int,
+    weights: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """
+    Computes confusion matrices of several prediction runs at once.
+
+    Args:
+        y_true (np.ndarray): Reference label codes, shape (n_frames,).
+        y_pred (np.ndarray): Predicted label codes, shape (n_runs, n_frames).
+        n_classes (int): Number of label codes.
+        weights (Optional[np.ndarray]): Per-frame weights, shape (n_frames,) or
+            (n_replicates, n_frames) to get one set of matrices per replicate.
+
+    Returns:
+        np.ndarray: Shape (n_runs, K, K), or (n_replicates, n_runs, K, K) for
+            2-D weights. Rows are reference labels, columns are predictions.
+    """
+    n_runs = y_pred.shape[0]
+    cells = (np.arange(n_runs)[:, None] * n_classes + y_true[None, :]) * n_classes + y_pred
+    size = n_runs * n_classes * n_classes
+
+    if weights is None or weights.ndim == 1:
+        counts = np.bincount(
+            cells.ravel(),
+            weights=None if weights is None else np.broadcast_to(weights, cells.shape).ravel(),
+            minlength=size,
+        )
+        return counts.reshape(n_runs, n_classes, n_classes)
+
+    n_replicates = weights.shape[0]
+    replicate_cells = cells[None, :, :] + (np.arange(n_replicates) * size)[:, None, None]
+    counts = np.bincount(
+        replicate_cells.ravel(),
+        weights=np.broadcast_to(weights[:, None, :], replicate_cells.shape).ravel(),
+        minlength=n_replicates * size,
+    )
+    return counts.reshape(n_replicates, n_runs, n_classes, n_classes)
+
+
+def _json_float(value) -> Optional[float]:
+    # NaN (e.g. precision of a never predicted class) is written as null
+    value = float(value)
+    return None if math.isnan(value) else value
+
+
+def _safe_divide(numerator: np.ndarray, denominator: np.ndarray) -> np.ndarray:
+    numerator, denominator = np.broadcast_arrays(
+        np.asarray(numerator, dtype=float), np.asarray(denominator, dtype=float)
+    )
+    return np.divide(
+        numerator,
+        denominator,
+        out=np.full(numerator.shape, np.nan),
+        where=denominator != 0,
+    )
+
+
+def cohens_kappa(confusion: np.ndarray) -> np.ndarray:
+    """
+    Computes Cohen's kappa from confusion matrices with shape (..., K, K).
+    """
+    total = confusion.sum(axis=(-2, -1))
+    observed = _safe_divide(np.trace(confusion, axis1=-2, axis2=-1), total)
+    expected = _safe_divide(
+        (confusion.sum(axis=-1) * confusion.sum(axis=-2)).sum(axis=-1), total**2
+    )
+    return _safe_divide(observed - expected, 1.0 - expected)
+
+
+def accuracy(confusion: np.ndarray) -> np.ndarray:
+    """
+    Computes accuracy from (possibly duration-weighted) confusion matrices.
+    """
+    return _safe_divide(
+        np.trace(confusion, axis1=-2, axis2=-1), confusion.sum(axis=(-2, -1))
+    )
+
+
+def precision_recall(confusion: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Computes per-class precision and recall from confusion matrices (..., K, K).
+    Classes that are never predicted (or never in the reference) get NaN.
+    """
+    true_positives = np.diagonal(confusion, axis1=-2, axis2=-1)
+    precision = _safe_divide(true_positives, confusion.sum(axis=-2))
+    recall = _safe_divide(true_positives, confusion.sum(axis=-1))
+    return precision, recall
+
+
+def bootstrap_metrics(
+    y_true: np.ndarray,
+    y_pred: np.ndarray,
+    n_classes: int,
+    durations: np.ndarray,
+    groups: np.ndarray,
+    num_bootstrap: int = 1000,
+    seed: int = 0,
+    max_chunk_elements: int = 4_000_000,
+) -> Dict[str, np.ndarray]:
+    """
+    Bootstraps kappa, accuracy and duration-weighted accuracy of all runs.
+
+    Resampling units are given by `groups` (e.g. one group per frame, or one
+    per video for a cluster bootstrap). Every replicate draws the units with
+    replacement; the same draw is shared by all runs, so the runs are compared
+    on paired samples. Replicates are evaluated in chunks to bound memory.
+
+    Returns:
+        Dict[str, np.ndarray]: Metric name to array of shape (num_bootstrap, n_runs).
+    """
+    rng = np.random.default_rng(seed)
+    n_runs, n_frames = y_pred.shape
+    n_groups = int(groups.max()) + 1
+    correct = (y_pred == y_true[None, :]).astype(float)
+
+    chunk_size = max(1, max_chunk_elements // max(1, n_runs * n_frames))
+    results = {"kappa": [], "accuracy": [], "duration_weighted_accuracy": []}
+    for start in range(0, num_bootstrap, chunk_size):
+        size = min(chunk_size, num_bootstrap - start)
+        # How many times each unit is drawn in each replicate
+        group_counts = rng.multinomial(
+            n_groups, np.full(n_groups, 1.0 / n_groups), size=size
+        )
+        frame_weights = group_counts[:, groups].astype(float)
+
+        confusion = confusion_matrices(y_true, y_pred, n_classes, frame_weights)
+        results["kappa"].append(cohens_kappa(confusion))
+        results["accuracy"].append(
+            _safe_divide(frame_weights @ correct.T, frame_weights.sum(axis=1)[:, None])
+        )
+        weighted = frame_weights * durations[None, :]
+        results["duration_weighted_accuracy"].append(
+            _safe_divide(weighted @ correct.T, weighted.sum(axis=1)[:, None])
+        )
+
+    return {name: np.concatenate(values) for name, values in results.items()}
+
+
+def evaluate_runs(
+    reference_path: str,
+    predictions_paths: List[str],
+    num_bootstrap: int = 1000,
+    confidence: float = 0.95,
+    bootstrap_unit: str = "frame",
+    seed: int = 0,
+    video_name: str = "video",
+) -> Dict:
+    """
+    Compares any number of prediction runs against the reference labels.
+
+    Args:
+        reference_path (str): Handmade labels ('.json' or results '.db').
+        predictions_paths (List[str]): Prediction runs ('.json' or results '.db').
+        num_bootstrap (int): Number of bootstrap replicates (0 disables confidence intervals).
+        confidence (float): Confidence level of the intervals.
+        bootstrap_unit (str): Resample 'frame's or whole 'video's.
+        seed (int): Seed of the bootstrap random generator.
+        video_name (str): Video name given to the scenes of '.json' inputs.
+
+    Frames are matched by (video name, cut scene number, frame position). If
+    the reference or the run is a '.json' file (named by `video_name`) and both
+    hold a single video, the run video is matched to the reference video even
+    if their names differ; this is logged and recorded as `matched_video`.
+    Videos of two '.db' inputs are only matched by name. Reference frames
+    missing from a run are scored as MISSING_LABEL and reported; a run that
+    matches no reference frame at all raises a ValueError.
+
+    Returns:
+        Dict: Labels and per-run metrics, ready to be saved as JSON.
+    """
+    keys, reference_labels, durations, videos = collect_frame_labels(
+        reference_path, video_name
+    )
+    reference_videos = set(videos)
+
+    # Frames without a handmade label are not evaluated
+    labeled = [i for i, label in enumerate(reference_labels) if label]
+    keys = [keys[i] for i in labeled]
+    reference_labels = [reference_labels[i] for i in labeled]
+    durations = np.asarray([durations[i] for i in labeled], dtype=float)
+    videos = [videos[i] for i in labeled]
+
+    predicted_labels = []
+    unmatched_frames = []
+    matched_videos = []
+    for predictions_path in predictions_paths:
+        run_keys, run_labels, _, run_videos = collect_frame_labels(
+            predictions_path, video_name
+        )
+        run_videos = set(run_videos)
+        matched_video = None
+        if (
+            not (reference_path.endswith(".db") and predictions_path.endswith(".db"))
+            and len(reference_videos) == 1
+            and len(run_videos) == 1
+            and run_videos != reference_videos
+        ):
+            (reference_video,) = reference_videos
+            (run_video,) = run_videos
+            logger.warning(
+                f"Matching video '{run_video}' of {predictions_path} "
+                f"to reference video '{reference_video}'"
+            )
+            run_keys = [(reference_video,) + key[1:] for key in run_keys]
+            matched_video = {"run": run_video, "reference": reference_video}
+        matched_videos.append(matched_video)
+
+        run_lookup = dict(zip(run_keys, run_labels))
+        num_unmatched = sum(1 for key in keys if key not in run_lookup)
+        if keys and num_unmatched == len(keys):
+            raise ValueError(
+                f"No reference frame found in {predictions_path}. "
+                "Check the video names (see --video_name)."
+            )
+        if num_unmatched:
+            logger.warning(
+                f"{num_unmatched} of {len(keys)} reference frames are missing in "
+                f"{predictions_path}; they are scored as '{MISSING_LABEL}'"
+            )
+        unmatched_frames.append(num_unmatched)
+        predicted_labels.append(
+            [run_lookup.get(key) or MISSING_LABEL for key in keys]
+        )
+
+    # Label-encode the reference and all runs with one shared vocabulary
+    all_labels = np.asarray(
+        reference_labels + [label for run in predicted_labels for label in run],
+        dtype=str,
+    )
+    label_names, codes = np.unique(all_labels, return_inverse=True)
+    n_frames = len(reference_labels)
+    n_classes = len(label_names)
+    y_true = codes[:n_frames]
+    y_pred = codes[n_frames:].reshape(len(predictions_paths), n_frames)
+
+    confusion = confusion_matrices(y_true, y_pred, n_classes)
+    duration_confusion = confusion_matrices(y_true, y_pred, n_classes, durations)
+    kappa = cohens_kappa(confusion)
+    frame_accuracy = accuracy(confusion)
+    duration_accuracy = accuracy(duration_confusion)
+    precision, recall = precision_recall(confusion)
+
+    intervals = None
+    if num_bootstrap > 0 and n_frames > 0:
+        if bootstrap_unit == "video":
+            _, groups = np.unique(np.asarray(videos, dtype=str), return_inverse=True)
+        elif bootstrap_unit == "frame":
+            groups = np.arange(n_frames)
+        else:
+            raise ValueError(f"Unsupported bootstrap unit: {bootstrap_unit}")
+
+        replicates = bootstrap_metrics(
+            y_true, y_pred, n_classes, durations, groups, num_bootstrap, seed
+        )
+        alpha = (1.0 - confidence) / 2.0
+        intervals = {
+            name: np.nanquantile(values, [alpha, 1.0 - alpha], axis=0)
+            for name, values in replicates.items()
+        }
+
+    support = confusion[0].sum(axis=1) if len(predictions_paths) else np.zeros(n_classes)
+    report = {
+        "reference_path": reference_path,
+        "num_frames": n_frames,
+        "total_seconds": float(durations.sum()),
+        "labels": label_names.tolist(),
+        "runs": [],
+    }
+    for run_idx, predictions_path in enumerate(predictions_paths):
+        run_report = {
+            "predictions_path": predictions_path,
+            "num_unmatched_frames": unmatched_frames[run_idx],
+            "matched_video": matched_videos[run_idx],
+            "kappa": _json_float(kappa[run_idx]),
+            "accuracy": _json_float(frame_accuracy[run_idx]),
+            "duration_weighted_accuracy": _json_float(duration_accuracy[run_idx]),
+            "per_class": {
+                label: {
+                    "precision": _json_float(precision[run_idx, class_idx]),
+                    "recall": _json_float(recall[run_idx, class_idx]),
+                    "support": int(support[class_idx]),
+                }
+                for class_idx, label in enumerate(report["labels"])
+            },
+            "confusion_matrix": confusion[run_idx].tolist(),
+        }
+        if intervals is not None:
+            for name, bounds in intervals.items():
+                run_report[f"{name}_ci"] = [
+                    _json_float(bounds[0, run_idx]),
+                    _json_float(bounds[1, run_idx]),
+                ]
+        report["runs"].append(run_report)
+
+    return report
+
+
+def _format_value(value: Optional[float]) -> str:
+    return "n/a" if value is None else f"{value:.3f}"
+
+
+def _format_metric(run_report: Dict, name: str) -> str:
+    text = _format_value(run_report[name])
+    if f"{name}_ci" in run_report:
+        low, high = run_report[f"{name}_ci"]
+        text += f" [{_format_value(low)}, {_format_value(high)}]"
+    return text
+
+
+if __name__ == "__main__":
+    # python -m evaluation_tools.evaluate_predictions --reference_path "./results/scenes_with_handmade_labels.json" --predictions_paths "./results/scenes_with_settings_predicted_simple_prompts.json" "./results/scenes_with_settings_predicted_simple_prompts2.json"
+    parser = argparse.ArgumentParser(
+        description="Evaluate prediction runs against handmade setting labels."
+    )
+
+    parser.add_argument(
+        "--reference_path",
+        type=str,
+        default=None,
+        help="Path to the handmade labels. Should be a '.json' file or a results '.db'.",
+    )
+    parser.add_argument(
+        "--predictions_paths",
+        type=str,
+        nargs="+",
+        default=[],
+        help="Paths to the prediction runs. Each should be a '.json' file or a results '.db'.",
+    )
+    parser.add_argument(
+        "--num_bootstrap",
+        type=int,
+        default=1000,
+        help="Number of bootstrap replicates for confidence intervals (0 to disable).",
+    )
+    parser.add_argument(
+        "--confidence",
+        type=float,
+        default=0.95,
+        help="Confidence level of the bootstrap intervals.",
+    )
+    parser.add_argument(
+        "--bootstrap_unit",
+        type=str,
+        default="frame",
+        choices=["frame", "video"],
+        help="Resample single frames or whole videos in the bootstrap.",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="Seed of the bootstrap random generator.",
+    )
+    parser.add_argument(
+        "--video_name",
+        type=str,
+        default="video",
+        help="Video name of '.json' inputs, to match them with videos of a results '.db'.",
+    )
+    parser.add_argument(
+        "--output_path",
+        type=str,
+        default=None,
+        help="Optional path to save the full report as a '.json' file.",
+    )
+
+    # Parse the arguments
+    args = parser.parse_args()
+
+    evaluation_report = evaluate_runs(
+        args.reference_path,
+        args.predictions_paths,
+        num_bootstrap=args.num_bootstrap,
+        confidence=args.confidence,
+        bootstrap_unit=args.bootstrap_unit,
+        seed=args.seed,
+        video_name=args.video_name,
+    )
+
+    print(
+        f"Evaluated {evaluation_report['num_frames']} labeled frames "
+        f"({evaluation_report['total_seconds']:.1f} seconds)."
+    )
+    for evaluated_run in evaluation_report["runs"]:
+        print(evaluated_run["predictions_path"])
+        if evaluated_run["matched_video"] is not None:
+            print(
+                f"    Matched video:              "
+                f"'{evaluated_run['matched_video']['run']}' -> "
+                f"'{evaluated_run['matched_video']['reference']}'"
+            )
+        if evaluated_run["num_unmatched_frames"]:
+            print(
+                f"    Missing reference frames:   {evaluated_run['num_unmatched_frames']}"
+            )
+        print(f"    Cohen's kappa:              {_format_metric(evaluated_run, 'kappa')}")
+        print(f"    Accuracy:                   {_format_metric(evaluated_run, 'accuracy')}")
+        print(
+            f"    Duration-weighted accuracy: "
+            f"{_format_metric(evaluated_run, 'duration_weighted_accuracy')}"
+        )
+
+    if args.output_path is not None:
+        with open(args.output_path, "w", encoding="utf-8") as json_file:
+            json.dump(
+                evaluation_report,
+                json_file,
+                ensure_ascii=False,
+                indent=4,
+                allow_nan=False,
+            )
+        print(f"Evaluation report saved to '{args.output_path}'.")
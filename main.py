@@ -2,83 +2,98 @@ import argparse
 import json
 import logging
 import os
+import sys
+import time
 
-from agents.frame_extraction import FrameExtractor
-from agents.image_captioning import ImageCaptioningAgent
-from agents.setting_classification import SettingClassifierAgent
-from agents.video_processing import VideoProcessor
-from dotenv import load_dotenv
+# Reference point of the cold start times logged by timed_stage
+STARTUP_TIME = time.perf_counter()
 
-if __name__ == "__main__":
-    # rm -rf ./frames ./logs
-    # python main.py --video_path "./input_data/minecraft.mp4" --num_processes 28 --possible_settings_path "./input_data/possible_settings_minecraft_processed.json"
-    parser = argparse.ArgumentParser(
-        description="Video settings classification with agents' orchestration."
-    )
+# Heavy dependencies (scenedetect, cv2, openai, dotenv) are imported inside the
+# stage functions below, so every subcommand only pays for what it uses and
+# spawned worker processes re-import this module cheaply.
 
-    parser.add_argument(
-        "--video_path",
-        type=str,
-        default=None,
-        help="Path to the input video data.",
-    )
-    parser.add_argument(
-        "--num_processes",
-        type=int,
-        default=1,
-        help="Number of processes to be used in multiprocessing.",
-    )
-    parser.add_argument(
-        "--possible_settings_path",
-        type=str,
-        default=None,
-        help="Path to the dictionary with possible settings.",
-    )
+RESULTS_DIR = "./results"
+SCENES_PATH = os.path.join(RESULTS_DIR, "scenes.json")
+FRAMES_PATH = os.path.join(RESULTS_DIR, "scenes_with_frames.json")
+CAPTIONS_PATH = os.path.join(RESULTS_DIR, "scenes_with_captions.json")
+SETTINGS_PATH = os.path.join(RESULTS_DIR, "scenes_with_settings_predicted.json")
 
-    # Parse the arguments
-    args = parser.parse_args()
+SUBCOMMANDS = ["detect", "extract", "caption", "classify", "run"]
 
-    # Configure logging
-    log_dir = "./logs"
-    os.makedirs(log_dir, exist_ok=True)
+main_logger = logging.getLogger(__name__)
+
+
+def load_scenes(path: str) -> list:
+    # Intermediate artifacts are JSON; '.pkl' is accepted for older results
+    if path.endswith(".pkl"):
+        import pickle
+
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+    with open(path, "r", encoding="utf-8") as json_file:
+        return json.load(json_file)
 
-    logging.basicConfig(
-        filename=os.path.join(log_dir, "main_log.txt"),
-        filemode="w",
-        format="%(asctime)s - %(name)s - %(levelname)s - \n%(message)s \n",
-        level=logging.INFO,
-    )
 
-    main_logger = logging.getLogger(__name__)
-    main_logger.info("Main pipeline process started.")
+def save_scenes(scenes: list, path: str):
+    save_dir = os.path.dirname(path)
+    if save_dir:
+        os.makedirs(save_dir, exist_ok=True)
 
+    with open(path, "w", encoding="utf-8") as json_file:
+        json.dump(scenes, json_file, ensure_ascii=False, indent=4)
+
+    main_logger.info(f"Saved {len(scenes)} scenes to {path}")
+
+
+def load_openai_api_key() -> str:
+    from dotenv import load_dotenv
+
+    load_dotenv()  # take environment variables from .env.
+    return os.getenv("OPENAI_API_KEY")
+
+
+def detect(args) -> list:
     # Step 1: Scene Detection
+    from agents.video_processing import VideoProcessor
+
     video_processor = VideoProcessor(
-        args.video_path, detector_type="content", threshold=27.0
+        args.video_path, detector_type=args.detector_type, threshold=args.threshold
     )
-    scenes = video_processor.detect_scenes()
+    return video_processor.detect_scenes()
 
+
+def extract(args, scenes: list) -> list:
     # Step 2: Frame Extraction
+    from agents.frame_extraction import FrameExtractor
+
     frame_extractor = FrameExtractor(
         video_path=args.video_path,
         scenes=scenes,
-        output_dir="frames",
-        frames_per_scene=1,  # You can adjust this to extract more frames per scene
+        output_dir=args.frames_dir,
+        frames_per_scene=args.frames_per_scene,
+        storage=args.frame_storage,
     )
-    scenes_with_frames = frame_extractor.extract_frames()
+    return frame_extractor.extract_frames()
 
+
+def caption(args, scenes: list) -> list:
     # Step 3: Image Captioning
-    load_dotenv()  # take environment variables from .env.
-    openai_api_key = os.getenv("OPENAI_API_KEY")
+    from agents.image_captioning import ImageCaptioningAgent
 
     image_captioning_agent = ImageCaptioningAgent(
         num_processes=args.num_processes,
-        scenes=scenes_with_frames,
-        openai_api_key=openai_api_key,
+        scenes=scenes,
+        openai_api_key=load_openai_api_key(),
+        start_method=args.start_method,
     )
-    scenes_with_captions = image_captioning_agent.generate_captions()
+    return image_captioning_agent.generate_captions()
+
 
+def classify(args, scenes: list) -> list:
     # Step 4: Setting Classification
+    from agents.setting_classification import SettingClassifierAgent
+
     with open(args.possible_settings_path, "r", encoding="utf-8") as json_file:
         possible_settings_dict = json.load(json_file)
     possible_settings = list(possible_settings_dict.keys())
@@ -86,17 +101,247 @@ if __name__ == "__main__":
 
     setting_classifier_agent = SettingClassifierAgent(
         num_processes=args.num_processes,
-        scenes=scenes_with_captions,
+        scenes=scenes,
         possible_settings=possible_settings,
-        openai_api_key=openai_api_key,
+        openai_api_key=load_openai_api_key(),
+        start_method=args.start_method,
     )
     scenes_with_settings = setting_classifier_agent.classify_settings()
     # Now scenes_with_settings contains settings per frame
     # You can proceed to aggregate settings or perform further analysis
 
+    if args.results_db is not None:
+        from agents.results_store import ResultsWriter
+
+        with ResultsWriter(args.results_db) as results_writer:
+            results_writer.write_video(args.video_name, scenes_with_settings)
+
+    return scenes_with_settings
+
+
+def timed_stage(name: str, stage, *stage_args) -> list:
+    # The stage duration includes the lazy imports of the stage
+    start_time = time.perf_counter()
+    main_logger.info(
+        f"Stage '{name}' started {start_time - STARTUP_TIME:.3f} seconds after startup."
+    )
+    scenes = stage(*stage_args)
+    main_logger.info(
+        f"Stage '{name}' finished in {time.perf_counter() - start_time:.2f} seconds."
+    )
+    return scenes
+
+
+def run_subcommand(args):
+    if args.command == "detect":
+        scenes = timed_stage("detect", detect, args)
+    elif args.command == "run":
+        # Full pipeline, keeping every intermediate artifact for partial re-runs
+        # next to the final output
+        results_dir = os.path.dirname(args.output_path)
+        scenes = timed_stage("detect", detect, args)
+        save_scenes(scenes, os.path.join(results_dir, os.path.basename(SCENES_PATH)))
+        scenes = timed_stage("extract", extract, args, scenes)
+        save_scenes(scenes, os.path.join(results_dir, os.path.basename(FRAMES_PATH)))
+        scenes = timed_stage("caption", caption, args, scenes)
+        save_scenes(
+            scenes, os.path.join(results_dir, os.path.basename(CAPTIONS_PATH))
+        )
+        scenes = timed_stage("classify", classify, args, scenes)
+    else:
+        stage = {"extract": extract, "caption": caption, "classify": classify}[
+            args.command
+        ]
+        scenes = timed_stage(args.command, stage, args, load_scenes(args.input_path))
+
     # Saving results
-    dir_to_save = "./results"
-    os.makedirs(dir_to_save, exist_ok=True)
-    json_file_path = os.path.join(dir_to_save, "scenes_with_settings_predicted.json")
-    with open(json_file_path, "w", encoding="utf-8") as json_file:
-        json.dump(scenes_with_settings, json_file, ensure_ascii=False, indent=4)
+    save_scenes(scenes, args.output_path)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Video settings classification with agents' orchestration."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    # Shared options of the stages
+    video_options = argparse.ArgumentParser(add_help=False)
+    video_options.add_argument(
+        "--video_path",
+        type=str,
+        default=None,
+        help="Path to the input video data.",
+    )
+
+    detect_options = argparse.ArgumentParser(add_help=False)
+    detect_options.add_argument(
+        "--detector_type",
+        type=str,
+        default="content",
+        choices=["content", "threshold"],
+        help="Scene detection method.",
+    )
+    detect_options.add_argument(
+        "--threshold",
+        type=float,
+        default=27.0,
+        help="Threshold of the scene detector.",
+    )
+
+    extract_options = argparse.ArgumentParser(add_help=False)
+    extract_options.add_argument(
+        "--frames_dir",
+        type=str,
+        default="frames",
+        help="Directory to store the extracted frames in.",
+    )
+    extract_options.add_argument(
+        "--frames_per_scene",
+        type=int,
+        default=1,
+        help="Number of frames to extract per scene.",
+    )
+    extract_options.add_argument(
+        "--frame_storage",
+        type=str,
+        default="pack",
+        choices=["pack", "loose"],
+        help="Store extracted frames in a single pack file per video or as loose JPEG files.",
+    )
+
+    worker_options = argparse.ArgumentParser(add_help=False)
+    worker_options.add_argument(
+        "--num_processes",
+        type=int,
+        default=1,
+        help="Number of processes to be used in multiprocessing.",
+    )
+    worker_options.add_argument(
+        "--start_method",
+        type=str,
+        default="spawn",
+        choices=["fork", "spawn", "forkserver"],
+        help="Start method of the worker processes. 'spawn' starts every worker "
+        "from a fresh interpreter that only imports the stage module.",
+    )
+
+    classify_options = argparse.ArgumentParser(add_help=False)
+    classify_options.add_argument(
+        "--possible_settings_path",
+        type=str,
+        default=None,
+        help="Path to the dictionary with possible settings.",
+    )
+    classify_options.add_argument(
+        "--results_db",
+        type=str,
+        default=None,
+        help="Optional path to a SQLite results database to also store the predictions in.",
+    )
+    classify_options.add_argument(
+        "--video_name",
+        type=str,
+        default=None,
+        help="Video name in the results database (defaults to the name of the "
+        "--video_path file, required otherwise).",
+    )
+
+    def io_options(input_path, output_path):
+        options = argparse.ArgumentParser(add_help=False)
+        if input_path is not None:
+            options.add_argument(
+                "--input_path",
+                type=str,
+                default=input_path,
+                help="Path to the input scenes ('.json' or '.pkl').",
+            )
+        options.add_argument(
+            "--output_path",
+            type=str,
+            default=output_path,
+            help="Path to save the output scenes to ('.json').",
+        )
+        return options
+
+    subparsers.add_parser(
+        "detect",
+        parents=[video_options, detect_options, io_options(None, SCENES_PATH)],
+        help="Detect scenes in the video.",
+    )
+    subparsers.add_parser(
+        "extract",
+        parents=[
+            video_options,
+            extract_options,
+            io_options(SCENES_PATH, FRAMES_PATH),
+        ],
+        help="Extract frames of the detected scenes.",
+    )
+    subparsers.add_parser(
+        "caption",
+        parents=[worker_options, io_options(FRAMES_PATH, CAPTIONS_PATH)],
+        help="Caption the extracted frames.",
+    )
+    subparsers.add_parser(
+        "classify",
+        parents=[
+            worker_options,
+            classify_options,
+            io_options(CAPTIONS_PATH, SETTINGS_PATH),
+        ],
+        help="Classify settings of the captioned frames.",
+    )
+    subparsers.add_parser(
+        "run",
+        parents=[
+            video_options,
+            detect_options,
+            extract_options,
+            worker_options,
+            classify_options,
+            io_options(None, SETTINGS_PATH),
+        ],
+        help="Run the full pipeline.",
+    )
+
+    return parser
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    # Without a subcommand the full pipeline is run, as before
+    if not argv or argv[0] not in SUBCOMMANDS + ["-h", "--help"]:
+        argv = ["run"] + list(argv)
+
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    # Checked before any stage runs, so a missing name does not cost a whole run
+    if getattr(args, "results_db", None) is not None and args.video_name is None:
+        if getattr(args, "video_path", None) is None:
+            parser.error(
+                "--video_name is required with --results_db without --video_path"
+            )
+        args.video_name = os.path.splitext(os.path.basename(args.video_path))[0]
+
+    # Configure logging
+    log_dir = "./logs"
+    os.makedirs(log_dir, exist_ok=True)
+
+    logging.basicConfig(
+        filename=os.path.join(log_dir, "main_log.txt"),
+        filemode="w",
+        format="%(asctime)s - %(name)s - %(levelname)s - \n%(message)s \n",
+        level=logging.INFO,
+    )
+
+    main_logger.info(f"Main pipeline process started: '{args.command}'.")
+    run_subcommand(args)
+
+
+if __name__ == "__main__":
+    # rm -rf ./frames ./logs
+    # python main.py run --video_path "./input_data/minecraft.mp4" --num_processes 28 --possible_settings_path "./input_data/possible_settings_minecraft_processed.json"
+    # python main.py classify --input_path "./results/scenes_with_captions.pkl" --num_processes 28 --possible_settings_path "./input_data/possible_settings_minecraft_processed.json"
+    main()
@@ -1,118 +1,399 @@
 import argparse
-import datetime
 import json
 import os
+import re
+import subprocess
 import sys
+from typing import Dict, Iterable, Iterator, Optional, Tuple
 
-working_dir = os.path.abspath("..")
+working_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, working_dir)
 
+# ASS file header
+ASS_HEADER = """[Script Info]
+; Script generated by Python
+Title: Subtitles
+ScriptType: v4.00+
+Collisions: Normal
+PlayResX: 640
+PlayResY: 480
+WrapStyle: 0
+ScaledBorderAndShadow: yes
+YCbCr Matrix: None
+
+[V4+ Styles]
+Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, Encoding
+Style: Default,Arial,24,&H00FFFFFF,&H0000FFFF,&H00000000,&H64000000,0,0,0,0,100,100,0,0,1,2,2,2,10,10,10,1
+
+[Events]
+Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
+"""
+
+_WHITESPACE = re.compile(r"\s*")
+
+
+def iter_json_array(path: str, chunk_size: int = 1 << 20) -> Iterator[Dict]:
+    """
+    Yields the objects of a top-level JSON array one by one, reading the file
+    in chunks instead of parsing it whole. Raises a ValueError if the file is
+    not exactly one JSON array.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as json_file:
+        buffer = ""
+        pos = 0
+        eof = False
+        started = False  # '[' was read
+        expect_item = True  # After '[' or ','
+        allow_end = True  # ']' is allowed after '[' or an item, not after ','
+
+        while True:
+            # Skip whitespace, which may span several chunks
+            pos = _WHITESPACE.match(buffer, pos).end()
+            if pos == len(buffer):
+                if eof:
+                    if not started:
+                        raise ValueError(f"Expected a JSON list of scenes in: {path}")
+                    raise ValueError(f"Unexpected end of the JSON list in: {path}")
+                chunk = json_file.read(chunk_size)
+                eof = not chunk
+                buffer = chunk
+                pos = 0
+                continue
+
+            char = buffer[pos]
+            if not started:
+                if char != "[":
+                    raise ValueError(f"Expected a JSON list of scenes in: {path}")
+                started = True
+                pos += 1
+                continue
+
+            if char == "]" and allow_end:
+                # Only whitespace may follow the list
+                rest = buffer[pos + 1 :]
+                while rest or not eof:
+                    if rest.strip():
+                        raise ValueError(
+                            f"Unexpected data after the JSON list in: {path}"
+                        )
+                    rest = json_file.read(chunk_size)
+                    eof = not rest
+                return
+
+            if not expect_item:
+                if char != ",":
+                    raise ValueError(
+                        f"Expected ',' or ']' after an item of the JSON list in: {path}"
+                    )
+                pos += 1
+                expect_item = True
+                allow_end = False
+                continue
+
+            if char in ",]":
+                raise ValueError(f"Expected an item of the JSON list in: {path}")
+
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+                complete = end < len(buffer) or eof
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                complete = False
+
+            if complete:
+                yield item
+                pos = end
+                expect_item = False
+                allow_end = True
+                continue
+
+            # The next item continues in the following chunk
+            chunk = json_file.read(chunk_size)
+            eof = not chunk
+            buffer = buffer[pos:] + chunk
+            pos = 0
+
+
+def iter_scenes(
+    path_to_subtitle_data: str, video_name: Optional[str] = None
+) -> Iterator[Dict]:
+    """
+    Yields scenes from a results '.json' file or from one video of a results '.db'.
+    """
+    if path_to_subtitle_data.endswith(".db"):
+        from agents.results_store import ResultsReader
+
+        with ResultsReader(path_to_subtitle_data) as reader:
+            if video_name is None:
+                videos = reader.videos()
+                if not videos:
+                    raise ValueError(
+                        f"Results database contains no videos: {path_to_subtitle_data}"
+                    )
+                video_name = videos[0]
+            yield from reader.load_video(video_name)
+    else:
+        yield from iter_json_array(path_to_subtitle_data)
+
+
+def timecode_to_seconds(timecode: str) -> float:
+    # 'HH:MM:SS.fff' -> seconds
+    hours, minutes, seconds = timecode.split(":")
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+
+def iter_subtitle_entries(scenes: Iterable[Dict]) -> Iterator[Tuple[float, float, str]]:
+    """
+    Yields (start_seconds, end_seconds, setting) for every labeled scene.
+    """
+    for scene in scenes:
+        captions = scene.get("captions")
+        if not captions or not captions[0].get("setting"):
+            continue
+
+        start = scene.get("start_seconds")
+        end = scene.get("end_seconds")
+        if start is None or end is None:
+            start = timecode_to_seconds(scene["start_timecode"])
+            end = timecode_to_seconds(scene["end_timecode"])
+
+        yield start, end, captions[0]["setting"]
+
+
+def merge_subtitle_entries(
+    entries: Iterable[Tuple[float, float, str]], max_gap: float = 0.1
+) -> Iterator[Tuple[float, float, str]]:
+    """
+    Merges consecutive entries with the same text into one subtitle event
+    when they are at most `max_gap` seconds apart.
+    """
+    current = None
+    for start, end, text in entries:
+        if current is not None and text == current[2] and start - current[1] <= max_gap:
+            current = (current[0], max(current[1], end), text)
+            continue
+        if current is not None:
+            yield current
+        current = (start, end, text)
+    if current is not None:
+        yield current
+
+
+def load_data(path_to_subtitle_data, merge=False, max_gap=0.1):
+    # Returns dictionaries with 'start_seconds', 'end_seconds' and 'setting'
+    # (timecode strings are no longer needed to write subtitles)
+    entries = iter_subtitle_entries(iter_scenes(path_to_subtitle_data))
+    if merge:
+        entries = merge_subtitle_entries(entries, max_gap)
+
+    return [
+        {"start_seconds": start, "end_seconds": end, "setting": setting}
+        for start, end, setting in entries
+    ]
+
+
+def _split_time(seconds: float, units_per_second: int) -> Tuple[int, int, int, int]:
+    # Integer arithmetic only: (hours, minutes, seconds, fraction in the given units)
+    units = int(seconds * units_per_second + 0.5)
+    total_seconds, fraction = divmod(units, units_per_second)
+    minutes, secs = divmod(total_seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    return hours, minutes, secs, fraction
+
+
+def format_ass_event(index: int, start: float, end: float, text: str) -> str:
+    # ASS format with centiseconds: 'H:MM:SS.cc'
+    sh, sm, ss, sc = _split_time(start, 100)
+    eh, em, es, ec = _split_time(end, 100)
+    text = text.replace("\n", "\\N")  # Replace newlines with ASS newline
+    return (
+        f"Dialogue: 0,{sh}:{sm:02d}:{ss:02d}.{sc:02d},{eh}:{em:02d}:{es:02d}.{ec:02d},"
+        f"Default,,0,0,0,,{text}\n"
+    )
 
-def load_data(path_to_subtitle_data):
-    # subtitle_data = [
-    #     {
-    #         "start_timecode": "00:00:01.00",
-    #         "end_timecode": "00:00:05.00",
-    #         "setting": "Hello, world!",
-    #     },
-    #     {
-    #         "start_timecode": "00:00:06.00",
-    #         "end_timecode": "00:00:10.00",
-    #         "setting": "This is a subtitle.",
-    #     },
-    #     # Add more entries as needed
-    # ]
-
-    with open(path_to_subtitle_data, "r", encoding="utf-8") as json_file:
-        scenes_with_handmade_labels = json.load(json_file)
-
-    subtitle_data = []
-    for scene in scenes_with_handmade_labels:
-        subtitle_data.append(
-            {
-                "start_timecode": scene["start_timecode"],
-                "end_timecode": scene["end_timecode"],
-                "setting": scene["captions"][0]["setting"],
-            }
-        )
 
-    return subtitle_data
-
-
-def timecode_to_ass_format(timecode):
-    # Convert 'HH:MM:SS.FF' to 'H:MM:SS.cc' (ASS format with centiseconds)
-    dt = datetime.datetime.strptime(timecode, "%H:%M:%S.%f")
-    total_seconds = dt.hour * 3600 + dt.minute * 60 + dt.second + dt.microsecond / 1e6
-    hours = int(total_seconds // 3600)
-    minutes = int((total_seconds % 3600) // 60)
-    seconds = int(total_seconds % 60)
-    centiseconds = int(round((total_seconds - int(total_seconds)) * 100))
-    return f"{hours}:{minutes:02d}:{seconds:02d}.{centiseconds:02d}"
-
-
-def create_save_subtitles(subtitle_data):
-    # ASS file header
-    ass_header = """[Script Info]
-    ; Script generated by Python
-    Title: Subtitles
-    ScriptType: v4.00+
-    Collisions: Normal
-    PlayResX: 640
-    PlayResY: 480
-    WrapStyle: 0
-    ScaledBorderAndShadow: yes
-    YCbCr Matrix: None
-
-    [V4+ Styles]
-    Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, Encoding
-    Style: Default,Arial,24,&H00FFFFFF,&H0000FFFF,&H00000000,&H64000000,0,0,0,0,100,100,0,0,1,2,2,2,10,10,10,1
-
-    [Events]
-    Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
+def format_srt_event(index: int, start: float, end: float, text: str) -> str:
+    # SRT format with milliseconds: 'HH:MM:SS,mmm'
+    sh, sm, ss, sms = _split_time(start, 1000)
+    eh, em, es, ems = _split_time(end, 1000)
+    return (
+        f"{index}\n{sh:02d}:{sm:02d}:{ss:02d},{sms:03d} --> "
+        f"{eh:02d}:{em:02d}:{es:02d},{ems:03d}\n{text}\n\n"
+    )
+
+
+def format_vtt_event(index: int, start: float, end: float, text: str) -> str:
+    # WebVTT format with milliseconds: 'HH:MM:SS.mmm'
+    sh, sm, ss, sms = _split_time(start, 1000)
+    eh, em, es, ems = _split_time(end, 1000)
+    text = text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+    return (
+        f"{sh:02d}:{sm:02d}:{ss:02d}.{sms:03d} --> "
+        f"{eh:02d}:{em:02d}:{es:02d}.{ems:03d}\n{text}\n\n"
+    )
+
+
+# Subtitle format -> (file header, event formatter)
+SUBTITLE_FORMATS = {
+    "ass": (ASS_HEADER, format_ass_event),
+    "srt": ("", format_srt_event),
+    "vtt": ("WEBVTT\n\n", format_vtt_event),
+}
+
+
+def write_subtitles(
+    entries: Iterable[Tuple[float, float, str]],
+    output_paths: Dict[str, str],
+    buffer_size: int = 1 << 20,
+) -> int:
     """
+    Writes subtitle events to one file per format in a single pass.
 
-    # Generate ASS events
-    ass_events = ""
-    for entry in subtitle_data:
-        start = timecode_to_ass_format(entry["start_timecode"])
-        end = timecode_to_ass_format(entry["end_timecode"])
-        text = entry["setting"].replace(
-            "\n", "\\N"
-        )  # Replace newlines with ASS newline
-        event_line = f"Dialogue: 0,{start},{end},Default,,0,0,0,,{text}\n"
-        ass_events += event_line
+    Args:
+        entries (Iterable[Tuple[float, float, str]]): (start_seconds, end_seconds, text) events.
+        output_paths (Dict[str, str]): Subtitle format ('ass', 'srt' or 'vtt') to output file path.
+        buffer_size (int): Size of the output buffer of every file.
 
-    # Combine header and events
-    ass_content = ass_header + ass_events
+    Returns:
+        int: Number of written subtitle events.
+    """
+    files = []
+    try:
+        for subtitle_format, output_path in output_paths.items():
+            header, format_event = SUBTITLE_FORMATS[subtitle_format]
+            output_dir = os.path.dirname(output_path)
+            if output_dir:
+                os.makedirs(output_dir, exist_ok=True)
+            output_file = open(
+                output_path, "w", encoding="utf-8", buffering=buffer_size
+            )
+            files.append((output_file, format_event))
+            output_file.write(header)
 
-    # Write to file
-    save_dir = "../results"
-    os.makedirs(save_dir, exist_ok=True)
+        count = 0
+        for count, (start, end, text) in enumerate(entries, start=1):
+            for output_file, format_event in files:
+                output_file.write(format_event(count, start, end, text))
+    finally:
+        for output_file, _ in files:
+            output_file.close()
 
-    with open(os.path.join(save_dir, "subtitles.ass"), "w", encoding="utf-8") as f:
-        f.write(ass_content)
+    return count
 
-    print("ASS subtitle file 'subtitles.ass' has been created.")
+
+def burn_subtitles(
+    video_path: str, subtitles_path: str, output_video_path: str
+) -> subprocess.CompletedProcess:
+    """
+    Renders the subtitles into the video with ffmpeg (must be installed).
+    """
+    # Escape characters that are special in ffmpeg filter arguments
+    escaped_path = (
+        subtitles_path.replace("\\", "/").replace(":", "\\:").replace("'", "\\'")
+    )
+    subtitle_filter = "ass" if subtitles_path.endswith(".ass") else "subtitles"
+
+    return subprocess.run(
+        [
+            "ffmpeg",
+            "-y",
+            "-i",
+            video_path,
+            "-vf",
+            f"{subtitle_filter}={escaped_path}",
+            "-c:a",
+            "copy",
+            output_video_path,
+        ],
+        check=True,
+    )
 
 
 if __name__ == "__main__":
-    # python generate_subtitles.py --path_to_subtitle_data "../results/scenes_with_settings_predicted.json"
+    # python generate_subtitles.py --path_to_subtitle_data "../results/scenes_with_settings_predicted.json" --subtitle_formats ass srt vtt
     parser = argparse.ArgumentParser(
-        description="Generating 'subtitles.ass' file for video subtitles."
+        description="Generating subtitle files ('.ass', '.srt', '.vtt') for video subtitles."
     )
 
     parser.add_argument(
         "--path_to_subtitle_data",
         type=str,
         default=None,
-        help="Path to the subtitle data. Should be a '.json' file",
+        help="Path to the subtitle data. Should be a '.json' file or a results '.db'",
+    )
+    parser.add_argument(
+        "--video_name",
+        type=str,
+        default=None,
+        help="Video to use from a results '.db' (the first one by default).",
+    )
+    parser.add_argument(
+        "--output_dir",
+        type=str,
+        default=None,
+        help="Directory for the subtitle files (defaults to the directory of the subtitle data).",
+    )
+    parser.add_argument(
+        "--subtitle_formats",
+        type=str,
+        nargs="+",
+        default=["ass"],
+        choices=sorted(SUBTITLE_FORMATS),
+        help="Subtitle formats to write.",
+    )
+    parser.add_argument(
+        "--max_gap",
+        type=float,
+        default=0.1,
+        help="Merge consecutive scenes with the same setting at most this many seconds apart.",
+    )
+    parser.add_argument(
+        "--no_merge",
+        action="store_true",
+        help="Write one subtitle event per scene instead of merging consecutive scenes.",
+    )
+    parser.add_argument(
+        "--burn_in_video",
+        type=str,
+        default=None,
+        help="Optional input video to render the (first) subtitle file into with ffmpeg.",
+    )
+    parser.add_argument(
+        "--output_video_path",
+        type=str,
+        default="output_video.mp4",
+        help="Path of the video with rendered subtitles.",
     )
 
     # Parse the arguments
     args = parser.parse_args()
 
-    # Load Data
-    subtitle_data = load_data(args.path_to_subtitle_data)
+    output_dir = args.output_dir
+    if output_dir is None:
+        output_dir = os.path.dirname(args.path_to_subtitle_data)
+    subtitle_paths = {
+        subtitle_format: os.path.join(output_dir, f"subtitles.{subtitle_format}")
+        for subtitle_format in args.subtitle_formats
+    }
+
+    # Stream scenes into subtitle events
+    subtitle_entries = iter_subtitle_entries(
+        iter_scenes(args.path_to_subtitle_data, args.video_name)
+    )
+    if not args.no_merge:
+        subtitle_entries = merge_subtitle_entries(subtitle_entries, args.max_gap)
 
-    # Generate and save 'subtitles.ass' file
-    create_save_subtitles(subtitle_data)
+    # Generate and save subtitle files
+    num_events = write_subtitles(subtitle_entries, subtitle_paths)
+    for subtitle_path in subtitle_paths.values():
+        print(f"Subtitle file '{subtitle_path}' has been created ({num_events} events).")
+
+    if args.burn_in_video is not None:
+        burn_subtitles(
+            args.burn_in_video,
+            subtitle_paths[args.subtitle_formats[0]],
+            args.output_video_path,
+        )
+        print(f"Video with subtitles '{args.output_video_path}' has been created.")